@@ -1,5 +1,9 @@
+import hashlib
+import logging
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional, TypeVar, Type
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterator, Optional, TypeVar, Type
 from pydantic import BaseModel
 
 from core.llm import LLMClient, get_llm
@@ -10,7 +14,11 @@ from kg.prompts import (
     get_keywords, STOP_WORDS
 )
 
+logger = logging.getLogger(__name__)
+
 MAXIMUM_MATCHED_ENTITIES = 10
+# Max LLM responses kept per agent for _call_llm(use_cache=True)
+LLM_CACHE_SIZE = 512
 
 # Configuration
 
@@ -67,6 +75,9 @@ class BaseAgent(ABC):
         self._neo4j = neo4j_client or get_neo4j()
         self._kg = kg_query or get_kg_query()
         self._config = get_config()
+        # LRU of raw LLM responses, keyed by a hash of the full request
+        self._llm_cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._llm_cache_lock = threading.Lock()
 
     @property
     def llm(self) -> LLMClient:
@@ -129,6 +140,20 @@ class BaseAgent(ABC):
         """
         return ""
 
+    @staticmethod
+    def _build_messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+        """
+        Chat messages for one LLM call.
+
+        The static system prompt always comes first and all request-specific
+        text goes in the user message, so the provider's automatic prefix
+        caching can reuse the system prompt across calls.
+        """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
     def _call_llm(
         self,
         system_prompt: str,
@@ -136,12 +161,34 @@ class BaseAgent(ABC):
         response_format: Optional[Type[T]] = None,
         temperature: float = 0.7,
         top_p: float = 0.92,
-        top_k: int = 50
+        top_k: int = 50,
+        max_tokens: Optional[int] = None,
+        response_schema: Optional[dict] = None,
+        use_cache: bool = False,
+        cache_tag: str = ""
     ) -> Any:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        # cache_tag separates requests that share prompts but must not share answers
+        if use_cache:
+            key = hashlib.blake2b(repr((
+                cache_tag, system_prompt, user_prompt, response_format, temperature,
+                top_p, top_k, max_tokens, response_schema
+            )).encode("utf-8"), digest_size=16).hexdigest()
+            with self._llm_cache_lock:
+                if key in self._llm_cache:
+                    self._llm_cache.move_to_end(key)
+                    return self._llm_cache[key]
+            response = self._call_llm(
+                system_prompt, user_prompt, response_format, temperature,
+                top_p, top_k, max_tokens, response_schema
+            )
+            if response:
+                with self._llm_cache_lock:
+                    self._llm_cache[key] = response
+                    if len(self._llm_cache) > LLM_CACHE_SIZE:
+                        self._llm_cache.popitem(last=False)
+            return response
+
+        messages = self._build_messages(system_prompt, user_prompt)
 
         # print(f" calling llm with temp={temperature}, top_p={top_p}, top_k={top_k}")
         if response_format:
@@ -149,9 +196,36 @@ class BaseAgent(ABC):
                 messages,
                 temperature=temperature,
                 top_p=top_p,
-                top_k=top_k)
+                top_k=top_k,
+                max_tokens=max_tokens)
         else:
-            return self._llm.chat(messages, temperature=temperature, top_p=top_p, top_k=top_k)
+            return self._llm.chat(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                response_schema=response_schema,
+                top_p=top_p,
+                top_k=top_k)
+
+    def _call_llm_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.7,
+        top_p: float = 0.92,
+        top_k: int = 50,
+        max_tokens: Optional[int] = None,
+        response_schema: Optional[dict] = None
+    ) -> Iterator[str]:
+        """Streaming variant of _call_llm, yields response text chunks"""
+        messages = self._build_messages(system_prompt, user_prompt)
+        return self._llm.chat_stream(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_schema=response_schema,
+            top_p=top_p,
+            top_k=top_k)
 
     def _validate_input(self, input_data: Dict[str, Any]) -> AgentInput:
         """Validate and normalize input data"""
@@ -159,18 +233,30 @@ class BaseAgent(ABC):
 
 class DietAgentMixin:
     """Mixin for diet-related agent capabilities"""
+    # Daily calorie adjustment per goal, applied to TDEE
+    _GOAL_CALORIE_ADJUSTMENTS = {
+        "weight_loss": -500,
+        "weight_gain": 500,
+        "muscle_building": 300,
+        "maintenance": 0
+    }
 
     def query_dietary_knowledge(
         self,
         conditions: List[str],
         restrictions: List[str] = [],
-        cared_rels: List[str] = None
+        cared_rels: List[str] = None,
+        raise_errors: bool = False
     ) -> List[Dict]:
-        """Query knowledge graph for dietary recommendations"""
+        """
+        Query knowledge graph for dietary recommendations.
+        Failed entity queries are skipped with a warning, or re-raised if raise_errors
+        is set (so callers can tell a partial result from a complete one).
+        """
         results = []
 
-        # Combine conditions and restrictions for unified search
-        all_entities = list(set(conditions + restrictions + DIETARY_QUERY_ENTITIES))
+        # Combine conditions and restrictions for unified search (deduplicated, order kept stable)
+        all_entities = list(dict.fromkeys(conditions + restrictions + DIETARY_QUERY_ENTITIES))
 
         # Use universal search for all entities
         for entity in all_entities:
@@ -198,7 +284,9 @@ class DietAgentMixin:
                     })
 
             except Exception as e:
-                print(f"[WARN] Failed to query entity {entity}: {e}")
+                if raise_errors:
+                    raise
+                logger.warning("Failed to query entity %s: %s", entity, e)
 
         return results
 
@@ -247,9 +335,9 @@ class DietAgentMixin:
                 # 1. Anchor Search: Find semantically similar entities
                 anchors = self._kg.search_similar_entities(user_query, top_k=rag_topk)
 
-                print(f"GraphRAG: Found {len(anchors)} anchor entities for query: '{user_query}'")
+                logger.info("GraphRAG: Found %d anchor entities for query: '%s'", len(anchors), user_query)
                 for anchor in anchors:
-                    print(f"  - Anchor: {anchor.get('name', 'N/A')} (score: {anchor.get('score', 0):.3f})")
+                    logger.debug("  - Anchor: %s (score: %.3f)", anchor.get('name', 'N/A'), anchor.get('score', 0))
 
                 # 2. Graph Traversal: Get neighbors for each anchor (1-hop)
                 seen_entities = set()
@@ -308,14 +396,14 @@ class DietAgentMixin:
                                 })
 
             except Exception as e:
-                print(f"[WARN] GraphRAG search failed, falling back to keyword search: {e}")
+                logger.warning("GraphRAG search failed, falling back to keyword search: %s", e)
                 # Fallback to keyword search if vector search fails
                 use_vector_search = False
 
         # === Fallback: Keyword-based Search (original logic) ===
         if not use_vector_search:
             # Extract words from user query
-            print(f"user_query={user_query}")
+            logger.debug("user_query=%s", user_query)
             keywords = get_keywords(user_query)
 
             # Search KG for each keyword
@@ -323,8 +411,8 @@ class DietAgentMixin:
             for keyword in keywords:
                 search_results = self._kg.search_entities(keyword)
 
-                print(f"searched result for keyword={keyword}")
-                print(search_results)
+                logger.debug("searched result for keyword=%s", keyword)
+                logger.debug("%s", search_results)
 
                 for result in search_results:
                     entity_name = result.get("head", result.get("tail", ""))
@@ -371,7 +459,7 @@ class DietAgentMixin:
                             })
 
             # Also query default dietary entities for additional context
-            all_entities_to_query = list(set(results["matched_entities"]))
+            all_entities_to_query = list(dict.fromkeys(results["matched_entities"]))
 
             # Use universal search for all entities (matched + default)
             for entity in all_entities_to_query[:10]:  # Limit total entities
@@ -416,7 +504,7 @@ class DietAgentMixin:
                                     "relation": rel_type
                                 })
                 except Exception as e:
-                    print(f"[WARN] Failed to query entity {entity}: {e}")
+                    logger.warning("Failed to query entity %s: %s", entity, e)
 
         return results
 
@@ -433,7 +521,7 @@ class DietAgentMixin:
         if kg_format_ver == 1:
             if entity_knowledge.get("matched_entities"):
                 entities = entity_knowledge["matched_entities"]
-                parts.append(f"- Matched Entities from KG: {', '.join(set(entities))}")
+                parts.append(f"- Matched Entities from KG: {', '.join(dict.fromkeys(entities))}")
 
             if entity_knowledge.get("entity_benefits"):
                 benefits = entity_knowledge["entity_benefits"][:MAXIMUM_MATCHED_ENTITIES]
@@ -569,14 +657,7 @@ class DietAgentMixin:
         tdee = bmr * activity_factor
 
         # Goal adjustment
-        adjustments = {
-            "weight_loss": -500,
-            "weight_gain": 500,
-            "muscle_building": 300,
-            "maintenance": 0
-        }
-
-        return int(tdee + adjustments.get(goal, 0))
+        return int(tdee + self._GOAL_CALORIE_ADJUSTMENTS.get(goal, 0))
 
 
 class ExerciseAgentMixin:
@@ -641,7 +722,7 @@ class ExerciseAgentMixin:
         cared_rels: List[str] = None
     ) -> List[Dict]:
         results = []
-        all_entities = list(set(conditions + EXERCISE_QUERY_ENTITIES))
+        all_entities = list(dict.fromkeys(conditions + EXERCISE_QUERY_ENTITIES))
 
 
         # Use universal search for all conditions
@@ -669,7 +750,7 @@ class ExerciseAgentMixin:
                         "condition": entity
                     })
             except Exception as e:
-                print(f"[WARN] Failed to query: {e}")
+                logger.warning("Failed to query: %s", e)
 
         return results
 
@@ -716,9 +797,9 @@ class ExerciseAgentMixin:
                 # 1. Anchor Search: Find semantically similar entities
                 anchors = self._kg.search_similar_entities(user_query, top_k=rag_topk)
 
-                print(f"GraphRAG Exercise: Found {len(anchors)} anchor entities for query: '{user_query}'")
+                logger.info("GraphRAG Exercise: Found %d anchor entities for query: '%s'", len(anchors), user_query)
                 for anchor in anchors:
-                    print(f"  - Anchor: {anchor.get('name', 'N/A')} (score: {anchor.get('score', 0):.3f})")
+                    logger.debug("  - Anchor: %s (score: %.3f)", anchor.get('name', 'N/A'), anchor.get('score', 0))
 
                 # 2. Graph Traversal: Get neighbors for each anchor (1-hop)
                 seen_entities = set()
@@ -777,7 +858,7 @@ class ExerciseAgentMixin:
                                 })
 
             except Exception as e:
-                print(f"[WARN] GraphRAG search failed, falling back to keyword search: {e}")
+                logger.warning("GraphRAG search failed, falling back to keyword search: %s", e)
                 use_vector_search = False
 
         # === Fallback: Keyword-based Search (original logic) ===
@@ -887,10 +968,10 @@ class ExerciseAgentMixin:
                                     "relation": f.get("relation", "")
                                 })
                 except Exception as e:
-                    print(f"[WARN] Failed to query entity {entity}: {e}")
+                    logger.warning("Failed to query entity %s: %s", entity, e)
 
             # Query default exercise entities for additional context
-            all_entities_to_query = list(set(results["matched_entities"] + EXERCISE_QUERY_ENTITIES))
+            all_entities_to_query = list(dict.fromkeys(results["matched_entities"] + EXERCISE_QUERY_ENTITIES))
 
             # Use universal search for all entities (matched + default)
             for entity in all_entities_to_query[:10]:  # Limit total entities
@@ -941,7 +1022,7 @@ class ExerciseAgentMixin:
                                     "relation": rel_type
                                 })
                 except Exception as e:
-                    print(f"[WARN] Failed to query entity {entity}: {e}")
+                    logger.warning("Failed to query entity %s: %s", entity, e)
 
         return results
 
@@ -973,7 +1054,7 @@ class ExerciseAgentMixin:
             # Legacy: format by categories
             if entity_knowledge.get("matched_entities"):
                 entities = entity_knowledge["matched_entities"]
-                parts.append(f"- Matched Entities from KG: {', '.join(set(entities))}")
+                parts.append(f"- Matched Entities from KG: {', '.join(dict.fromkeys(entities))}")
 
             if entity_knowledge.get("entity_benefits"):
                 benefits = entity_knowledge["entity_benefits"][:MAXIMUM_MATCHED_ENTITIES]  # Limit to top 5
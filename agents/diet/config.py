@@ -1,21 +1,47 @@
 UNIT_LIST_STR = '["gram", "ml", "piece", "slice", "cup", "bowl", "spoon"]'
 
-PROTEIN_SOURCES = [
+# Output budget for one meal's JSON item list (a typical meal is well under 400 tokens)
+BASE_PLAN_MAX_TOKENS = 512
+# Per-meal overrides; snacks are one to three items
+MEAL_MAX_TOKENS = {"snacks": 256}
+
+# Ask for one-letter item keys (n/p/u/c) to cut output tokens; BaseFoodItem accepts both forms.
+# Off by default: with schema-constrained decoding the full key names are enforced instead.
+COMPACT_ITEM_KEYS = False
+
+# Upper bound on plausible kcal per portion unit (pure fat is ~9 kcal/g); LLM items
+# above portion_number * bound are dropped as miscounted
+MAX_KCAL_PER_UNIT = {
+    "gram": 9,
+    "ml": 9,
+    "piece": 600,
+    "slice": 400,
+    "cup": 900,
+    "bowl": 1200,
+    "spoon": 120
+}
+
+# Snack targets below this (kcal) get a canned single-item plan instead of an LLM call,
+# for users without medical conditions, dietary restrictions or an explicit request
+MIN_SNACK_KCAL = 120
+
+# Ingredient pools are read-only, so they are tuples
+PROTEIN_SOURCES = (
     "Cod Fillet", "Salmon", "Tofu", "Lean Beef Steak", "Shrimp",
     "Turkey Breast", "Pork Tenderloin", "Lamb Chop", "Edamame", "Tempeh",
     "Duck Breast", "Tuna Steak", "Sardines", "Chickpeas"
-]
+)
 
-CARB_SOURCES = [
+CARB_SOURCES = (
     "Quinoa", "Sweet Potato", "Buckwheat", "Whole Wheat Pasta", "Couscous",
     "Barley", "Corn", "Multigrain Bread", "Red Potato", "Wild Rice",
     "Polenta", "Bulgur", "Millet"
-]
+)
 
-VEG_SOURCES = [
+VEG_SOURCES = (
     "Asparagus", "Spinach", "Kale", "Zucchini", "Bell Peppers",
     "Eggplant", "Cauliflower", "Green Beans", "Brussels Sprouts",
     "Bok Choy", "Artichokes", "Mushrooms", "Snow Peas"
-]
+)
 
-COMMON_BORING_FOODS = ["Chicken Breast", "Brown Rice", "Broccoli", "Boiled Egg"]
+COMMON_BORING_FOODS = ("Chicken Breast", "Brown Rice", "Broccoli", "Boiled Egg")
@@ -1,33 +1,99 @@
+import functools
 import json
+import logging
+import operator
 import random
-import re
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union
+from pydantic import TypeAdapter, ValidationError
 from agents.base import BaseAgent, DietAgentMixin
 from agents.diet.models import (
     FoodItem,
     DietRecommendation, DietAgentInput,
-    BaseFoodItem
+    BaseFoodItem, RawDietPlan
 )
 from agents.diet.parser_var import DietPlanParser
-from core.llm.utils import parse_json_response
+from core.llm.utils import parse_json_response, extract_json_text, iter_json_list_items
 from agents.diet.config import *
 from kg.prompts import (
     available_strategies, available_cuisines, GET_DIET_GENERATION_SYSTEM_PROMPT,
-    build_diet_prompt
+    GET_DIET_MULTI_MEAL_SYSTEM_PROMPT, build_diet_prompt, build_multi_meal_instruction
 )
 
-
-
-def _to_food_item(item_dict: Dict[str, Any]) -> FoodItem:
-    """Transform parser output to FoodItem format for DietRecommendation"""
-    return FoodItem(
-        food=item_dict.get("food_name", ""),
-        portion=f"{item_dict.get('portion_number', '')}{item_dict.get('portion_unit', '')}",
-        calories=int(round(item_dict.get("total_calories", 0))),
-        # protein=0.0,  # Placeholder - not tracked in new format
-        # carbs=0.0,    # Placeholder
-        # fat=0.0        # Placeholder
-    )
+logger = logging.getLogger(__name__)
+
+# Validates a whole LLM item list in one pydantic-core pass
+_BASE_ITEMS_ADAPTER = TypeAdapter(List[BaseFoodItem])
+# Passed to backends with schema-constrained decoding (api_model.structured_output);
+# the schema uses full key names, so it is not sent when compact keys are requested
+_RAW_PLAN_SCHEMA = None if COMPACT_ITEM_KEYS else RawDietPlan.model_json_schema()
+
+
+# Share of the daily calorie target given to each meal
+_MEAL_RATIOS = {
+    "breakfast": 0.25,
+    "lunch": 0.35,
+    "dinner": 0.30,
+    "snacks": 0.10
+}
+# Used for meal types outside _MEAL_RATIOS
+_DEFAULT_MEAL_RATIO = 0.25
+
+# Activity factor per fitness level, applied to BMR
+_ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "beginner": 1.375,
+    "intermediate": 1.55,
+    "advanced": 1.725
+}
+
+def _canned_snack(target: int) -> List[BaseFoodItem]:
+    """Single-item snack for budgets below MIN_SNACK_KCAL (apple, ~0.5 kcal per gram)"""
+    return [BaseFoodItem(
+        food_name="Apple",
+        portion_number=max(1, round(target / 0.52)),
+        portion_unit="gram",
+        total_calories=float(target)
+    )]
+
+
+def _drop_implausible(items: List[BaseFoodItem], meal_type: str) -> List[BaseFoodItem]:
+    """Drop items whose calories exceed MAX_KCAL_PER_UNIT for their portion (e.g. 150g at 1800 kcal)"""
+    kept = []
+    for item in items:
+        cap = MAX_KCAL_PER_UNIT.get(item.portion_unit)
+        if cap and item.total_calories is not None and item.total_calories > item.portion_number * cap:
+            logger.warning(
+                "Dropping %s for %s: %s kcal for %s%s",
+                item.food_name, meal_type, item.total_calories, item.portion_number, item.portion_unit
+            )
+            continue
+        kept.append(item)
+    return kept
+
+
+# Fields of a DietPlanParser output item, in FoodItem order
+_food_item_fields = operator.itemgetter("food_name", "portion_number", "portion_unit", "total_calories")
+
+
+def _to_food_items(meal_items: List[Dict[str, Any]]) -> Tuple[List[FoodItem], int]:
+    """Transform one variant's parser output to FoodItems, totalling calories in the same pass"""
+    food_items = []
+    total_cal = 0
+    for item_dict in meal_items:
+        food_name, portion_number, portion_unit, total_calories = _food_item_fields(item_dict)
+        calories = int(round(total_calories or 0))
+        total_cal += calories
+        # Parser output is already typed, so skip re-validation
+        food_items.append(FoodItem.model_construct(
+            food=food_name or "",
+            portion=f"{portion_number}{portion_unit}",
+            calories=calories,
+            # protein=0.0,  # Placeholder - not tracked in new format
+            # carbs=0.0,    # Placeholder
+            # fat=0.0        # Placeholder
+        ))
+    return food_items, total_cal
 
 
 def build_constraint_prompt(protein: str, carb: str, veg: str, excluded: List[str] = None) -> str:
@@ -35,12 +101,11 @@ def build_constraint_prompt(protein: str, carb: str, veg: str, excluded: List[st
     # prompt += f"- Main Protein: {protein}\n"
     # prompt += f"- Carb Source: {carb}\n"
     # prompt += f"- Vegetable: {veg}\n"
-    prompt = ""
+    parts = []
     if excluded:
-        prompt += f"\n## Excluded Ingredients (DO NOT USE)\n"
-        prompt += f"- {', '.join(excluded)}\n"
+        parts.append(f"\n## Excluded Ingredients (DO NOT USE)\n- {', '.join(excluded)}\n")
 
-    return prompt
+    return "".join(parts)
 
 
 # ================= Diet Agent =================
@@ -54,6 +119,8 @@ class DietAgent(BaseAgent, DietAgentMixin):
         self.num_variants = num_variants
         self.min_scale = min_scale
         self.max_scale = max_scale
+        # The KG is static while the service runs, so condition lookups are memoized per agent
+        self._cached_dietary_knowledge = functools.lru_cache(maxsize=256)(self._query_dietary_knowledge_tuple)
 
     def get_agent_name(self) -> str:
         return "diet"
@@ -66,7 +133,7 @@ class DietAgent(BaseAgent, DietAgentMixin):
 
     def generate(
         self,
-        input_data: Dict[str, Any],
+        input_data: Union[DietAgentInput, Dict[str, Any]],
         num_variants: int = 3,
         min_scale: float = 0.5,
         max_scale: float = 1.5,
@@ -77,21 +144,213 @@ class DietAgent(BaseAgent, DietAgentMixin):
         user_preference: str = None,
         use_vector: bool = True,  # GraphRAG: use vector search instead of keyword matching
         rag_topk: int = 3,
-        kg_context: str = None
+        kg_context: str = None,
+        stream: bool = False,  # Parse items while the LLM response is still streaming
+        seed: Optional[int] = None,  # Fix the strategy/cuisine/exclusion draws for reproducible runs
+        batch_meals: bool = False,  # Ask for all meals in one LLM call, falling back per meal
+        use_cache: bool = True,  # Reuse LLM responses for repeated greedy (temperature 0) requests
+        max_deviation_pct: Optional[float] = None,  # Drop candidates further than this from their meal target
+        deterministic: bool = False  # Greedy decoding; variants then differ only by the parser's scaling
     ) -> List[DietRecommendation]:
-        # Reinitialize parser if variant configuration changed
+        if deterministic:
+            # Greedy decoding makes repeated requests reproducible and lets them hit the LLM cache
+            temperature, top_p, top_k = 0.0, 1.0, 1
+        parser = self._get_parser(num_variants, min_scale, max_scale)
+        # Per-call generator: seeded runs are reproducible and concurrent calls don't share state
+        rng = random.Random(seed)
+
+        # Define meal types to generate
+        if meal_type:
+            meal_types = [meal_type]
+        else:
+            meal_types = list(_MEAL_RATIOS)
+
+        plan = self._plan_meals(
+            input_data, meal_types, user_preference, use_vector, rag_topk, kg_context, rng
+        )
+        if plan is None:
+            return [], kg_context or ""
+
+        user_meta = plan["user_meta"]
+        env = plan["environment"]
+        requirement = plan["requirement"]
+        target_calories = plan["target_calories"]
+        kg_context = plan["kg_context"]
+        meal_targets = plan["meal_targets"]
+        meal_selections = plan["meal_selections"]
+
+        # Only greedy responses are reproducible, so only those are reused. seed drives
+        # the local strategy/cuisine draws and is not sent to the model, so it can't
+        # make sampled responses repeatable
+        cache_llm = use_cache and not stream and temperature == 0
+
+        # A very small snack budget doesn't need an LLM round-trip
+        canned_snack = plan["canned_snack"]
+
+        # Optionally plan every LLM-backed meal in a single request; meals it
+        # misses are generated individually below
+        batched_plans = {}
+        if batch_meals and not stream:
+            batch_targets = {
+                mt: meal_targets[mt]
+                for mt in meal_types
+                if not (mt == "snacks" and canned_snack)
+            }
+            if len(batch_targets) > 1:
+                batched_plans = self._generate_all_meals(
+                    plan, batch_targets, user_preference, temperature, top_p, top_k,
+                    use_cache=cache_llm
+                )
+
+        def generate_meal(selection):
+            mt, strategy, cuisine, excluded = selection
+            if mt == "snacks" and canned_snack:
+                return _canned_snack(meal_targets["snacks"])
+            if batched_plans.get(mt):
+                return batched_plans[mt]
+            try:
+                return self._generate_base_plan(
+                    user_meta=user_meta,
+                    environment=env,
+                    requirement=requirement,
+                    target_calories=target_calories,
+                    meal_type=mt,
+                    kg_context=kg_context,
+                    temperature=temperature,
+                    top_p=top_p,
+                    top_k=top_k,
+                    strategy=strategy,
+                    cuisine=cuisine,
+                    # constraint_prompt=constraint_prompt,
+                    constraint_prompt="",
+                    user_preference=user_preference,
+                    stream=stream,
+                    prompts=plan["meal_prompts"][mt],
+                    use_cache=cache_llm
+                )
+            except Exception as e:
+                # One failed meal should not discard the others
+                logger.warning("Base plan generation failed for %s: %s", mt, e)
+                return None
+
+        # Meals are independent, network-bound LLM calls: issue them concurrently
+        if len(meal_selections) > 1:
+            with ThreadPoolExecutor(max_workers=len(meal_selections)) as executor:
+                meal_results = list(executor.map(generate_meal, meal_selections))
+        else:
+            meal_results = [generate_meal(selection) for selection in meal_selections]
+
+        if not any(meal_results):
+            logger.warning("No base plans generated for any meal type")
+            return [], kg_context
+
+        return self._build_candidates(plan, meal_results, parser, max_deviation_pct), kg_context
+
+    def generate_batch(
+        self,
+        users: List[Union[DietAgentInput, Dict[str, Any]]],
+        meal_types: Optional[List[str]] = None,
+        num_variants: int = 3,
+        min_scale: float = 0.5,
+        max_scale: float = 1.5,
+        temperature: float = 0.7,
+        user_preference: str = None,
+        use_vector: bool = True,
+        rag_topk: int = 3,
+        seed: Optional[int] = None,
+        max_deviation_pct: Optional[float] = None,
+        poll_interval: float = 30.0
+    ) -> List[Tuple[List[DietRecommendation], str]]:
+        """
+        Generate candidates for many users through the provider's Batch API.
+
+        All (user, meal_type) base plans are submitted as one offline batch job,
+        which is billed at the provider's batch rate but may take up to the
+        completion window (24h) to finish; this call blocks until it does.
+        Use generate() for interactive requests; generate_diet_candidates_batch
+        runs a list of requests in-process without the Batch API.
+        Args:
+            users: DietAgentInput (or its dict form) per user
+            meal_types: Meals to plan for every user (default: all)
+        Returns:
+            One (candidates, kg_context) pair per user, in input order
+        """
+        parser = self._get_parser(num_variants, min_scale, max_scale)
+        rng = random.Random(seed)
+        meal_types = list(meal_types or _MEAL_RATIOS)
+
+        plans = [
+            self._plan_meals(input_data, meal_types, user_preference, use_vector, rag_topk, None, rng)
+            for input_data in users
+        ]
+
+        requests = {}
+        for user_idx, plan in enumerate(plans):
+            if plan is None:
+                continue
+            for mt, _, _, _ in plan["meal_selections"]:
+                if mt == "snacks" and plan["canned_snack"]:
+                    continue
+                system_prompt, full_prompt = plan["meal_prompts"][mt]
+                requests[f"{user_idx}:{mt}"] = {
+                    "messages": self._build_messages(system_prompt, full_prompt),
+                    "temperature": temperature,
+                    "max_tokens": MEAL_MAX_TOKENS.get(mt, BASE_PLAN_MAX_TOKENS),
+                    "response_schema": _RAW_PLAN_SCHEMA
+                }
+        responses = self._llm.chat_batch(requests, poll_interval=poll_interval) if requests else {}
+
+        results = []
+        for user_idx, plan in enumerate(plans):
+            if plan is None:
+                results.append(([], ""))
+                continue
+            meal_results = []
+            for mt, _, _, _ in plan["meal_selections"]:
+                if mt == "snacks" and plan["canned_snack"]:
+                    meal_results.append(_canned_snack(plan["meal_targets"]["snacks"]))
+                else:
+                    meal_results.append(self._parse_base_response(responses.get(f"{user_idx}:{mt}"), mt))
+            candidates = self._build_candidates(plan, meal_results, parser, max_deviation_pct)
+            results.append((candidates, plan["kg_context"]))
+        return results
+
+    def _get_parser(self, num_variants: int, min_scale: float, max_scale: float) -> DietPlanParser:
+        """The agent's parser, or a call-local one if the variant configuration differs"""
+        # Fail before any KG/LLM work rather than after the base plans are generated
+        if num_variants < 1:
+            raise ValueError(f"num_variants must be >= 1, got {num_variants}")
+        # A call-local parser keeps a shared agent from being mutated by concurrent callers
         if (num_variants != self.num_variants or
             min_scale != self.min_scale or
             max_scale != self.max_scale):
-            self.parser = DietPlanParser(num_variants=num_variants, min_scale=min_scale, max_scale=max_scale)
-            self.num_variants = num_variants
-            self.min_scale = min_scale
-            self.max_scale = max_scale
+            return DietPlanParser(num_variants=num_variants, min_scale=min_scale, max_scale=max_scale)
+        return self.parser
+
+    def _plan_meals(
+        self,
+        input_data: Union[DietAgentInput, Dict[str, Any]],
+        meal_types: List[str],
+        user_preference: str = None,
+        use_vector: bool = True,
+        rag_topk: int = 3,
+        kg_context: str = None,
+        rng: random.Random = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Everything needed to request one user's base plans: calorie targets, KG
+        context, per-meal strategy/cuisine/exclusions and the rendered prompts.
+        Returns None if the user has no positive calorie target.
+        """
         # KG Format Version
         KG_FORMAT_VER = 3
+        rng = rng or random.Random()
 
-        # Parse input
-        input_obj = DietAgentInput(**input_data)
+        # Parse input; an already validated DietAgentInput is used as is
+        if isinstance(input_data, DietAgentInput):
+            input_obj = input_data
+        else:
+            input_obj = DietAgentInput.model_validate(input_data)
 
         user_meta = input_obj.user_metadata
         env = input_obj.environment
@@ -105,6 +364,10 @@ class DietAgent(BaseAgent, DietAgentMixin):
             goal=requirement.get("goal", "maintenance"),
             activity_factor=self._get_activity_factor(user_meta.get("fitness_level", "beginner"))
         )
+        if target_calories <= 0:
+            # Nothing sensible to plan for; don't spend KG queries or LLM calls on it
+            logger.warning("Non-positive daily calorie target %s, no candidates generated", target_calories)
+            return None
 
         if kg_context is None:
             # Get KG context
@@ -113,10 +376,10 @@ class DietAgent(BaseAgent, DietAgentMixin):
 
             # Query condition-based KG context
             if conditions:
-                dietary_knowledge = self.query_dietary_knowledge(
+                dietary_knowledge = self._get_dietary_knowledge(
                     conditions, user_meta.get("dietary_restrictions", [])
                 )
-                kg_context = self._format_kg_context(dietary_knowledge)
+                kg_context = self._format_kg_context(dietary_knowledge, rng)
 
             # Query entity-based KG context when user_preference is provided
             if user_preference:
@@ -128,25 +391,23 @@ class DietAgent(BaseAgent, DietAgentMixin):
                 )
                 entity_context = self._format_dietary_entity_kg_context(entity_knowledge, kg_format_ver=KG_FORMAT_VER)
                 kg_context += entity_context
-        else:
-            pass
-
-        # Define meal types to generate
-        if meal_type:
-            meal_types = [meal_type]
-        else:
-            meal_types = ["breakfast", "lunch", "dinner", "snacks"]
 
-        # Get variant names from parser configuration
-        variant_names = [name for name, _ in self.parser.variant_configs]
-        
-        used_strategies = set()
-        used_combinations = set()
+        # Calorie targets per meal type
+        meal_targets = {
+            mt: int(target_calories * _MEAL_RATIOS.get(mt, _DEFAULT_MEAL_RATIO))
+            for mt in dict.fromkeys([*_MEAL_RATIOS, *meal_types])
+        }
 
-        # Collect base plans for each meal type
-        meal_base_plans: Dict[str, Dict[str, Any]] = {}
+        # One shuffle per call; cycling through the shuffled pools gives every meal
+        # a different strategy and cuisine until a pool is exhausted
+        if not user_preference:
+            strategies = rng.sample(available_strategies, k=len(available_strategies))
+            cuisines = rng.sample(available_cuisines, k=len(available_cuisines))
 
-        for mt in meal_types:
+        # Pick strategy/cuisine/exclusions for every meal up front, in meal order,
+        # so the LLM calls can run concurrently
+        meal_selections = []
+        for meal_idx, mt in enumerate(meal_types):
             # Select strategy and cuisine - DISABLE random constraints when user_preference exists
             # When user has a specific request, let LLM decide based on user intent
             if user_preference:
@@ -154,74 +415,68 @@ class DietAgent(BaseAgent, DietAgentMixin):
                 cuisine = "As Requested"   # Let LLM infer from query
                 excluded = []
             else:
-                remaining_strategies = [s for s in available_strategies if s not in used_strategies]
-                if not remaining_strategies:
-                    remaining_strategies = available_strategies
-
-                strategy = random.choice(remaining_strategies)
-                used_strategies.add(strategy)
-
-                cuisine = random.choice(available_cuisines)
+                strategy = strategies[meal_idx % len(strategies)]
+                cuisine = cuisines[meal_idx % len(cuisines)]
 
                 excluded = []
-                if random.random() > 0.5:
-                    excluded = random.sample(COMMON_BORING_FOODS, k=random.randint(1, 2))
-                    
-            base_items = self._generate_base_plan(
-                user_meta=user_meta,
-                environment=env,
-                requirement=requirement,
-                target_calories=target_calories,
-                meal_type=mt,
-                kg_context=kg_context,
-                temperature=temperature,
-                top_p=top_p,
-                top_k=top_k,
-                strategy=strategy,
-                cuisine=cuisine,
-                # constraint_prompt=constraint_prompt,
-                constraint_prompt="",
-                user_preference=user_preference
+                if rng.random() > 0.5:
+                    excluded = rng.sample(COMMON_BORING_FOODS, k=rng.randint(1, 2))
+            meal_selections.append((mt, strategy, cuisine, excluded))
+
+        # Each meal's prompt states its meal type and calorie target
+        meal_prompts = {
+            mt: self._build_full_prompt(
+                user_meta, env, requirement, target_calories, mt,
+                kg_context, user_preference=user_preference, meal_target=meal_targets[mt]
             )
-            if base_items:
-                meal_base_plans[mt] = {
-                    "items": base_items,
-                    "strategy": strategy,
-                    "cuisine": cuisine,
-                    "excluded": excluded
-                }
+            for mt in meal_types
+        }
 
-        if not meal_base_plans:
-            print("[WARN] No base plans generated for any meal type")
-            return []
+        return {
+            "user_meta": user_meta,
+            "environment": env,
+            "requirement": requirement,
+            "target_calories": target_calories,
+            "kg_context": kg_context,
+            "meal_targets": meal_targets,
+            "meal_selections": meal_selections,
+            "meal_prompts": meal_prompts,
+            # A very small snack budget doesn't need an LLM round-trip, but only when
+            # nothing user-specific (conditions, restrictions, requests) could rule it out
+            "canned_snack": (
+                0 < meal_targets["snacks"] < MIN_SNACK_KCAL
+                and not user_preference
+                and not user_meta.get("medical_conditions")
+                and not user_meta.get("dietary_restrictions")
+            )
+        }
 
-        # Expand each meal to variants
-        expanded_meals: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
-        for meal_type, plan_info in meal_base_plans.items():
-            expanded_meals[meal_type] = self.parser.expand_plan(plan_info["items"], variant_names)
+    def _build_candidates(
+        self,
+        plan: Dict[str, Any],
+        meal_results: List[Optional[List[BaseFoodItem]]],
+        parser: DietPlanParser,
+        max_deviation_pct: Optional[float] = None
+    ) -> List[DietRecommendation]:
+        """Expand each meal's base plan into scaled variants and turn them into candidates"""
+        # Get variant names from parser configuration
+        variant_names = [name for name, _ in parser.variant_configs]
+        meal_targets = plan["meal_targets"]
 
         candidates = []
         candidate_id = 1
 
-        # Calorie targets per meal type
-        meal_targets = {
-            "breakfast": int(target_calories * 0.25),
-            "lunch": int(target_calories * 0.35),
-            "dinner": int(target_calories * 0.30),
-            "snacks": int(target_calories * 0.10)
-        }
-
-        for meal_type in meal_types:
-            if meal_type not in expanded_meals:
+        # Expand each base plan and turn its variants into candidates in one pass
+        for (meal_type, strategy, cuisine, excluded), base_items in zip(plan["meal_selections"], meal_results):
+            if not base_items:
                 continue
 
-            # Get strategy and cuisine for this meal
-            plan_info = meal_base_plans.get(meal_type, {})
-            strategy = plan_info.get("strategy", "balanced")
-            cuisine = plan_info.get("cuisine", "General")
+            target = meal_targets[meal_type]
+            if target <= 0:
+                logger.warning("Non-positive calorie target for %s, skipping", meal_type)
+                continue
 
-            meal_variants = expanded_meals[meal_type]
-            target = meal_targets.get(meal_type, int(target_calories * 0.25))
+            meal_variants = parser.expand_plan(base_items, variant_names)
 
             for variant_name in variant_names:
                 meal_items = meal_variants.get(variant_name, [])
@@ -229,18 +484,22 @@ class DietAgent(BaseAgent, DietAgentMixin):
                     continue
 
                 # Transform to FoodItem format
-                food_items = [_to_food_item(item) for item in meal_items]
-                total_cal = sum(item.calories for item in food_items)
+                food_items, total_cal = _to_food_items(meal_items)
 
-                # Calculate deviation
-                deviation = round(((total_cal - target) / target) * 100, 1)
+                # Calculate deviation; totals are ints, so this is a single exact-input division
+                deviation = round((total_cal - target) * 100 / target, 1)
+                if max_deviation_pct is not None and abs(deviation) > max_deviation_pct:
+                    continue
 
                 # Build safety notes
                 safety_notes = [f"Meal: {meal_type}", f"Variant: {variant_name}"]
-                safety_notes.append(f"Style: {cuisine}, Strategy: {strategy}")
-                excluded = plan_info.get("excluded", [])
-                if excluded:
-                    safety_notes.append(f"Excluded: {', '.join(excluded)}")
+                if meal_type == "snacks" and plan["canned_snack"]:
+                    # No LLM call was made, so the strategy/cuisine/exclusion draws don't apply
+                    safety_notes.append("Preset snack for a small calorie budget")
+                else:
+                    safety_notes.append(f"Style: {cuisine}, Strategy: {strategy}")
+                    if excluded:
+                        safety_notes.append(f"Excluded: {', '.join(excluded)}")
                 if abs(deviation) > 10:
                     safety_notes.append(f"Calorie deviation: {deviation}%")
 
@@ -258,9 +517,10 @@ class DietAgent(BaseAgent, DietAgentMixin):
                 candidate_id += 1
 
         # Sort by deviation
-        candidates.sort(key=lambda x: (x.meal_type, abs(x.calories_deviation)))
+        if len(candidates) > 1:
+            candidates.sort(key=lambda x: (x.meal_type, abs(x.calories_deviation)))
 
-        return candidates, kg_context
+        return candidates
 
     def _generate_base_plan(
         self,
@@ -276,18 +536,76 @@ class DietAgent(BaseAgent, DietAgentMixin):
         strategy: str = "balanced",
         cuisine: str = "General",
         constraint_prompt: str = "",
-        user_preference: str = None
+        user_preference: str = None,
+        stream: bool = False,
+        prompts: Optional[Tuple[str, str]] = None,
+        use_cache: bool = False,
+        cache_tag: str = ""
     ) -> Optional[List[BaseFoodItem]]:
         """Generate base food items for a single meal type with diversity injection"""
+        if prompts is None:
+            prompts = self._build_full_prompt(
+                user_meta, environment, requirement, target_calories, meal_type,
+                kg_context, strategy, cuisine, constraint_prompt, user_preference
+            )
+        system_prompt, full_prompt = prompts
+        if stream:
+            # Validate each item as soon as it closes, overlapping parsing with decoding
+            chunks = self._call_llm_stream(
+                system_prompt=system_prompt,
+                user_prompt=full_prompt,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k,
+                max_tokens=MEAL_MAX_TOKENS.get(meal_type, BASE_PLAN_MAX_TOKENS),
+                response_schema=_RAW_PLAN_SCHEMA
+            )
+            items = []
+            try:
+                for i, item_json in enumerate(iter_json_list_items(chunks)):
+                    try:
+                        items.append(BaseFoodItem.model_validate_json(item_json))
+                    except ValidationError as e:
+                        logger.warning("Failed to parse item %d: %s", i, e)
+            finally:
+                # The scan stops at the list's closing bracket; release the stream and log it now
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+            items = _drop_implausible(items, meal_type)
+            if not items:
+                logger.warning("No valid items streamed for %s", meal_type)
+                return None
+            return items
 
-        strategy_guidance = {
-            "balanced": "Focus on balanced nutrition across all macros.",
-            "protein_focus": "Emphasize high-protein foods for muscle maintenance.",
-            "variety": "Include diverse food types and colors.",
-            "low_carb": "Reduce carbohydrate intake slightly, focus on quality fats and proteins.",
-            "fiber_rich": "Prioritize high-fiber vegetables and whole grains."
-        }
+        response = self._call_llm(
+            system_prompt=system_prompt,
+            user_prompt=full_prompt,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            max_tokens=MEAL_MAX_TOKENS.get(meal_type, BASE_PLAN_MAX_TOKENS),
+            response_schema=_RAW_PLAN_SCHEMA,
+            use_cache=use_cache,
+            cache_tag=cache_tag
+        )
+        return self._parse_base_response(response, meal_type)
 
+    def _build_full_prompt(
+        self,
+        user_meta: Dict[str, Any],
+        environment: Dict[str, Any],
+        requirement: Dict[str, Any],
+        target_calories: int,
+        meal_type: str,
+        kg_context: str = "",
+        strategy: str = "balanced",
+        cuisine: str = "General",
+        constraint_prompt: str = "",
+        user_preference: str = None,
+        meal_target: Optional[int] = None
+    ) -> Tuple[str, str]:
+        """Return the (system, user) prompt pair for one meal's base plan"""
         # user_prompt = self._build_diet_prompt(
         user_prompt = build_diet_prompt(
             user_meta=user_meta,
@@ -296,58 +614,141 @@ class DietAgent(BaseAgent, DietAgentMixin):
             target_calories=target_calories,
             meal_type=meal_type,
             kg_context=kg_context,
-            user_preference=user_preference
+            user_preference=user_preference,
+            target=meal_target
         )
 
         full_prompt = user_prompt
-        # full_prompt = user_prompt + f"\n\n### Optimization Strategy: {strategy.upper()}\n{strategy_guidance.get(strategy, '')}"
         # full_prompt += f"\n\n### Culinary Style: {cuisine}\nPLEASE strictly follow this style. Use ingredients and cooking methods typical for {cuisine} cuisine."
         # full_prompt += constraint_prompt
 
-        DIET_GENERATION_SYSTEM_PROMPT = GET_DIET_GENERATION_SYSTEM_PROMPT()
-        response = self._call_llm(
-            system_prompt=DIET_GENERATION_SYSTEM_PROMPT,
-            user_prompt=full_prompt,
-            temperature=temperature,
-            top_p=top_p,
-            top_k=top_k
-        )
+        return GET_DIET_GENERATION_SYSTEM_PROMPT(compact=COMPACT_ITEM_KEYS), full_prompt
 
+    def _generate_all_meals(
+        self,
+        plan: Dict[str, Any],
+        meal_targets: Dict[str, int],
+        user_preference: str = None,
+        temperature: float = 0.85,
+        top_p: float = 0.92,
+        top_k: int = 50,
+        use_cache: bool = False,
+        cache_tag: str = ""
+    ) -> Dict[str, List[BaseFoodItem]]:
+        """
+        Generate base plans for several meals in one LLM call; returns only the meals that parsed.
+        Any failure, including an LLM/API error, returns {} so callers fall back to per-meal calls.
+        """
+        # No meal block: the multi-meal instruction lists every meal and its target
+        full_prompt = build_diet_prompt(
+            user_meta=plan["user_meta"],
+            environment=plan["environment"],
+            requirement=plan["requirement"],
+            target_calories=plan["target_calories"],
+            kg_context=plan["kg_context"],
+            user_preference=user_preference
+        )
+        try:
+            response = self._call_llm(
+                # The per-meal system prompt asks for a single list; this call needs an object
+                system_prompt=GET_DIET_MULTI_MEAL_SYSTEM_PROMPT(compact=COMPACT_ITEM_KEYS),
+                user_prompt=full_prompt + build_multi_meal_instruction(meal_targets),
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k,
+                max_tokens=sum(MEAL_MAX_TOKENS.get(mt, BASE_PLAN_MAX_TOKENS) for mt in meal_targets),
+                use_cache=use_cache,
+                cache_tag=cache_tag
+            )
+        except Exception as e:
+            logger.warning("Batched meal generation failed, falling back per meal: %s", e)
+            return {}
+        if not response:
+            logger.warning("LLM returned empty for batched meals")
+            return {}
+        try:
+            data = parse_json_response(response)
+        except json.JSONDecodeError as e:
+            logger.warning("Invalid JSON for batched meals: %s", e)
+            return {}
+        if not isinstance(data, dict):
+            logger.warning("Expected object keyed by meal, got %s", type(data))
+            return {}
+
+        plans = {}
+        for meal_type in meal_targets:
+            meal_data = data.get(meal_type)
+            items = self._validate_items(meal_data, meal_type) if isinstance(meal_data, list) else None
+            if items:
+                plans[meal_type] = items
+        return plans
+
+    def _parse_base_response(self, response: Any, meal_type: str) -> Optional[List[BaseFoodItem]]:
+        """Parse a raw LLM response into BaseFoodItem list, or None if unusable"""
         if not response or response == {}:
-            print(f"[WARN] LLM returned empty for {meal_type}")
+            logger.warning("LLM returned empty for %s", meal_type)
             return None
 
+        if isinstance(response, str):
+            # Fast path: decode and validate the item list in one pydantic-core pass
+            try:
+                items = _drop_implausible(_BASE_ITEMS_ADAPTER.validate_json(extract_json_text(response)), meal_type)
+                return items if items else None
+            except ValidationError:
+                pass
+
         try:
             data = parse_json_response(response)
         except json.JSONDecodeError as e:
-            print(f"[WARN] Invalid JSON for {meal_type}: {e}")
+            logger.warning("Invalid JSON for %s: %s", meal_type, e)
             return None
 
+        # Schema-constrained backends return the RawDietPlan object form
+        if isinstance(data, dict) and isinstance(data.get("items"), list):
+            data = data["items"]
+
         # Parse to BaseFoodItem list
         if isinstance(data, list):
+            return self._validate_items(data, meal_type)
+        else:
+            logger.warning("Expected list, got %s", type(data))
+            return None
+
+    def _validate_items(self, data: List[Any], meal_type: str) -> Optional[List[BaseFoodItem]]:
+        """Validate a decoded item list, keeping the valid items if only some are malformed"""
+        try:
+            items = _BASE_ITEMS_ADAPTER.validate_python(data)
+        except ValidationError:
+            # Salvage the valid items when only some of them are malformed
             items = []
             for i, item_data in enumerate(data):
                 try:
                     item = BaseFoodItem(**item_data)
                     items.append(item)
                 except Exception as e:
-                    print(f"[WARN] Failed to parse item {i}: {e}")
-            return items if items else None
-        else:
-            print(f"[WARN] Expected list, got {type(data)}")
-            return None
+                    logger.warning("Failed to parse item %d for %s: %s", i, meal_type, e)
+        items = _drop_implausible(items, meal_type)
+        return items if items else None
+
+    def _get_dietary_knowledge(self, conditions: List[str], restrictions: List[str]) -> List[Dict]:
+        """Condition-based KG knowledge, cached per (conditions, restrictions) pair"""
+        key = (tuple(sorted(conditions)), tuple(sorted(restrictions)))
+        try:
+            return list(self._cached_dietary_knowledge(*key))
+        except Exception as e:
+            # A failed lookup is not cached; serve what the KG returns now and retry next call
+            logger.warning("KG lookup incomplete, not caching: %s", e)
+            return self.query_dietary_knowledge(list(key[0]), list(key[1]))
+
+    def _query_dietary_knowledge_tuple(self, conditions: tuple, restrictions: tuple) -> tuple:
+        # Raises on any failed entity query, so lru_cache only stores complete lookups
+        return tuple(self.query_dietary_knowledge(list(conditions), list(restrictions), raise_errors=True))
 
     def _get_activity_factor(self, fitness_level: str) -> float:
         """Get activity factor from fitness level"""
-        factors = {
-            "sedentary": 1.2,
-            "beginner": 1.375,
-            "intermediate": 1.55,
-            "advanced": 1.725
-        }
-        return factors.get(fitness_level, 1.2)
+        return _ACTIVITY_FACTORS.get(fitness_level, 1.2)
 
-    def _format_kg_context(self, knowledge: List) -> str:
+    def _format_kg_context(self, knowledge: List, rng: random.Random = None) -> str:
         """Format KG knowledge for prompt"""
         if not knowledge:
             return ""
@@ -357,8 +758,8 @@ class DietAgent(BaseAgent, DietAgentMixin):
         # set maximum input lengths = 20
         maximum_inputs = 20
         if len(knowledge)>maximum_inputs:
-            random.shuffle(knowledge)
-            knowledge = knowledge[:maximum_inputs]
+            # O(k) draw that leaves the caller's list untouched
+            knowledge = (rng or random).sample(knowledge, maximum_inputs)
         
         for item in knowledge:
             entity_name = item.get('entity', "name")
@@ -378,6 +779,12 @@ class DietAgent(BaseAgent, DietAgentMixin):
 
 # ================= Convenience Functions =================
 
+@functools.lru_cache(maxsize=1)
+def _get_agent() -> DietAgent:
+    """Shared DietAgent; generate() keeps per-call variant settings local"""
+    return DietAgent()
+
+
 def generate_diet_candidates(
     user_metadata: Dict[str, Any],
     environment: Dict[str, Any] = {},
@@ -392,21 +799,60 @@ def generate_diet_candidates(
     user_preference: str = None,
     use_vector: bool = False,
     rag_topk: str = 3,
-    kg_context: str = None
+    kg_context: str = None,
+    stream: bool = False,
+    seed: Optional[int] = None,
+    batch_meals: bool = False,
+    use_cache: bool = True,
+    max_deviation_pct: Optional[float] = None,
+    deterministic: bool = False
 ) -> List[DietRecommendation]:
-    agent = DietAgent(num_variants=num_variants, min_scale=min_scale, max_scale=max_scale)
-    input_data = {
-        "user_metadata": user_metadata,
-        "environment": environment,
-        "user_requirement": user_requirement,
-    }
+    agent = _get_agent()
+    input_data = DietAgentInput(
+        user_metadata=user_metadata,
+        environment=environment,
+        user_requirement=user_requirement
+    )
     return agent.generate(
         input_data, num_variants, min_scale, max_scale,
         meal_type, temperature, top_p, top_k, user_preference, use_vector, rag_topk,
-        kg_context=kg_context
+        kg_context=kg_context,
+        stream=stream,
+        seed=seed,
+        batch_meals=batch_meals,
+        use_cache=use_cache,
+        max_deviation_pct=max_deviation_pct,
+        deterministic=deterministic
     )
 
 
+def generate_diet_candidates_batch(inputs: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Run generate_diet_candidates for a batch of requests in this process, one
+    after another, issuing one generation per distinct request.
+    For offline jobs through the provider's Batch API, see DietAgent.generate_batch.
+    Args:
+        inputs: List of keyword-argument dicts for generate_diet_candidates
+    Returns:
+        One result per input, in input order; repeats of a request get deep
+        copies of its candidates, so editing one result never changes another
+    Note:
+        Identical requests get the same sampled plan. Callers that repeat a
+        request on purpose to get diverse samples should not batch them.
+    """
+    results_by_key = {}
+    results = []
+    for kwargs in inputs:
+        key = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        if key not in results_by_key:
+            results_by_key[key] = generate_diet_candidates(**kwargs)
+            results.append(results_by_key[key])
+            continue
+        candidates, kg_context = results_by_key[key]
+        results.append(([c.model_copy(deep=True) for c in candidates], kg_context))
+    return results
+
+
 if __name__ == "__main__":
     # Test the generator
     test_input = {
@@ -3,7 +3,7 @@ Diet Agent Models
 Pydantic models for diet recommendation input/output.
 """
 from typing import List, Dict, Any, Optional, Literal
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 from enum import Enum
 
 
@@ -22,10 +22,11 @@ ALLOWED_UNITS = Literal["gram", "ml", "piece", "slice", "cup", "bowl", "spoon"]
 
 class BaseFoodItem(BaseModel):
     """LLM output: Base food item with standardized units for parser expansion"""
-    food_name: str = Field(..., description="Name of the food dish")
-    portion_number: float = Field(..., description="Numeric quantity (e.g., 100, 1.5)")
-    portion_unit: ALLOWED_UNITS = Field(..., description="Unit: gram, ml, piece, slice, cup, bowl, or spoon")
-    total_calories: Optional[float] = Field(None, description="Total calories for this portion size (preferred)")
+    # Short keys (n/p/u/c) are accepted for the compact output format
+    food_name: str = Field(..., validation_alias=AliasChoices("food_name", "n"), description="Name of the food dish")
+    portion_number: float = Field(..., validation_alias=AliasChoices("portion_number", "p"), description="Numeric quantity (e.g., 100, 1.5)")
+    portion_unit: ALLOWED_UNITS = Field(..., validation_alias=AliasChoices("portion_unit", "u"), description="Unit: gram, ml, piece, slice, cup, bowl, or spoon")
+    total_calories: Optional[float] = Field(None, validation_alias=AliasChoices("total_calories", "c"), description="Total calories for this portion size (preferred)")
     calories_per_unit: Optional[float] = Field(None, description="Legacy: calories per unit (deprecated, use total_calories)")
 
     model_config = {
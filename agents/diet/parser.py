@@ -57,10 +57,12 @@ class DietPlanParser:
         unit = item.portion_unit
         original_num = item.portion_number
 
-        if hasattr(item, 'total_calories') and item.total_calories is not None:
-            original_total = item.total_calories
-        elif hasattr(item, 'calories_per_unit') and item.calories_per_unit is not None:
-            original_total = item.calories_per_unit * original_num
+        total_calories = getattr(item, 'total_calories', None)
+        calories_per_unit = getattr(item, 'calories_per_unit', None)
+        if total_calories is not None:
+            original_total = total_calories
+        elif calories_per_unit is not None:
+            original_total = calories_per_unit * original_num
         else:
             original_total = 0
 
@@ -1,8 +1,20 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple
 from .models import BaseFoodItem
 
+
+class _FastItem(NamedTuple):
+    """Plain per-item values used during expansion (no pydantic overhead)"""
+    name: str
+    unit: str
+    qty: float
+    total: float
+    cpu: float
+
+
 class DietPlanParser:
     def __init__(self, num_variants: int = 3, min_scale: float = 0.5, max_scale: float = 1.5):
+        if num_variants < 1:
+            raise ValueError(f"num_variants must be >= 1, got {num_variants}")
         # Generate variant configurations uniformly distributed between min_scale and max_scale
         self.num_variants = num_variants
         self.min_scale = min_scale
@@ -45,42 +57,49 @@ class DietPlanParser:
     ) -> Dict[str, List[Dict[str, Any]]]:
         if variants is None:
             variants = [name for name, _ in self.variant_configs]
+        # Resolve per-item values once; only the portion number depends on the variant
+        prepared = [self._prepare_item(item) for item in base_items]
         result = {}
         for variant_name in variants:
             scale_factor = self.variants.get(variant_name, 1.0)
-            expanded_items = []
-            for item in base_items:
-                new_item = self._scale_item(item, scale_factor)
-                new_item["_variant"] = variant_name
-                expanded_items.append(new_item)
-            result[variant_name] = expanded_items
+            result[variant_name] = [
+                self._scale_prepared(prepared_item, scale_factor, variant_name)
+                for prepared_item in prepared
+            ]
         return result
 
-    def _scale_item(
-        self,
-        item: BaseFoodItem,
-        scale_factor: float
-    ) -> Dict[str, Any]:
-        unit = item.portion_unit
+    def _prepare_item(self, item: BaseFoodItem) -> _FastItem:
         original_num = item.portion_number
-        if hasattr(item, 'total_calories') and item.total_calories is not None:
-            original_total = item.total_calories
-        elif hasattr(item, 'calories_per_unit') and item.calories_per_unit is not None:
-            original_total = item.calories_per_unit * original_num
+        total_calories = getattr(item, 'total_calories', None)
+        calories_per_unit = getattr(item, 'calories_per_unit', None)
+        if total_calories is not None:
+            original_total = total_calories
+        elif calories_per_unit is not None:
+            original_total = calories_per_unit * original_num
         else:
             original_total = 0
         calories_per_unit = original_total / original_num if original_num > 0 else 0
-        scaled_num = self._calculate_scaled_number(original_num, unit, scale_factor)
+        return _FastItem(item.food_name, item.portion_unit, original_num, original_total, round(calories_per_unit, 2))
+
+    def _scale_prepared(
+        self,
+        prepared: _FastItem,
+        scale_factor: float,
+        variant_name: str
+    ) -> Dict[str, Any]:
+        original_num = prepared.qty
+        scaled_num = self._calculate_scaled_number(original_num, prepared.unit, scale_factor)
         if original_num > 0:
-            total_calories = round(original_total * (scaled_num / original_num), 1)
+            total_calories = round(prepared.total * (scaled_num / original_num), 1)
         else:
-            total_calories = original_total
+            total_calories = prepared.total
         return {
-            "food_name": item.food_name,
+            "food_name": prepared.name,
             "portion_number": scaled_num,
-            "portion_unit": unit,
-            "calories_per_unit": round(calories_per_unit, 2),
-            "total_calories": total_calories
+            "portion_unit": prepared.unit,
+            "calories_per_unit": prepared.cpu,
+            "total_calories": total_calories,
+            "_variant": variant_name
         }
 
     def _calculate_scaled_number(
@@ -1,7 +1,9 @@
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from openai import OpenAI
 from config_loader import get_config
 from core.llm.utils import parse_messages_to_str, parse_response_to_str
@@ -20,12 +22,21 @@ def get_model_name() -> str:
     return config.get("api_model", {}).get("model", "deepseek-chat")
 
 
+def get_structured_output_mode() -> Optional[str]:
+    """Schema-constrained decoding supported by the backend: "json_schema", "guided_json" or None"""
+    config = get_config()
+    return config.get("api_model", {}).get("structured_output") or None
+
+
 class LLMClient:
 
     def __init__(self, model: Optional[str] = None):
         self.client = get_llm_client()
         self.model = model or get_model_name()
         self._log_path = self._get_log_path()
+        self.structured_output = get_structured_output_mode()
+        # Calls may run concurrently (e.g. one per meal); keep log entries whole
+        self._log_lock = threading.Lock()
 
     def _get_log_path(self) -> str:
         try:
@@ -55,16 +66,31 @@ class LLMClient:
                 ""
             ]
             output_text = "\n".join(output_lines)
-            with open(self._log_path, "a", encoding="utf-8") as f:
+            with self._log_lock, open(self._log_path, "a", encoding="utf-8") as f:
                 f.write(output_text)
         except Exception as e:
             print(f"[WARN] Failed to write LLM log: {e}")
 
+    def _schema_kwargs(self, response_schema: Optional[dict]) -> Dict[str, Any]:
+        """Request arguments that constrain decoding to response_schema, if the backend supports it"""
+        if not response_schema or not self.structured_output:
+            return {}
+        if self.structured_output == "guided_json":
+            # vLLM OpenAI-compatible server
+            return {"extra_body": {"guided_json": response_schema}}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": response_schema.get("title", "response"), "schema": response_schema}
+            }
+        }
+
     def chat(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.0,
         max_tokens: Optional[int] = None,
+        response_schema: Optional[dict] = None,
         **kwargs
         ) -> str:
         start_time = datetime.now()
@@ -72,13 +98,116 @@ class LLMClient:
             model=self.model,
             messages=messages,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            **self._schema_kwargs(response_schema)
         )
         content = resp.choices[0].message.content
         duration_ms = (datetime.now() - start_time).total_seconds() * 1000
         self._log(messages, {"content": content}, duration_ms)
         return content
 
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        response_schema: Optional[dict] = None,
+        **kwargs
+        ) -> Iterator[str]:
+        """
+        Yield response content deltas as they are decoded; logs the response at the end.
+        Callers that stop early should close() the generator: the HTTP stream is then
+        closed and the content received so far is still logged.
+        """
+        start_time = datetime.now()
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **self._schema_kwargs(response_schema)
+        )
+        parts = []
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            stream.close()
+            duration_ms = (datetime.now() - start_time).total_seconds() * 1000
+            self._log(messages, {"content": "".join(parts)}, duration_ms)
+
+    def chat_batch(
+        self,
+        requests: Dict[str, Dict[str, Any]],
+        poll_interval: float = 30.0,
+        completion_window: str = "24h"
+        ) -> Dict[str, str]:
+        """
+        Run many chat requests as one offline job through the provider's Batch API.
+
+        requests maps a caller-chosen custom_id to chat() arguments (messages,
+        temperature, max_tokens, response_schema). Blocks until the job ends and
+        returns the response content of every request that succeeded, by custom_id.
+        """
+        lines = []
+        for custom_id, request in requests.items():
+            body = {
+                "model": self.model,
+                "messages": request["messages"],
+                "temperature": request.get("temperature", 0.0),
+                "max_tokens": request.get("max_tokens"),
+            }
+            schema_kwargs = self._schema_kwargs(request.get("response_schema"))
+            # extra_body fields are top-level request fields in a batch line
+            body.update(schema_kwargs.pop("extra_body", {}))
+            body.update(schema_kwargs)
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body
+            }, ensure_ascii=False))
+
+        start_time = datetime.now()
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=completion_window
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+        duration_ms = (datetime.now() - start_time).total_seconds() * 1000
+
+        if batch.status != "completed":
+            print(f"[WARN] Batch {batch.id} ended with status {batch.status}")
+        if not batch.output_file_id:
+            return {}
+
+        results = {}
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                print(f"[WARN] Batch request {record.get('custom_id')} failed: {record.get('error')}")
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[record["custom_id"]] = content
+            self._log(requests[record["custom_id"]]["messages"], {"content": content}, duration_ms)
+        return results
+
     def chat_with_json(
         self,
         messages: List[Dict[str, str]],
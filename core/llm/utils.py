@@ -1,6 +1,13 @@
 import json
 import re
 
+try:
+    # orjson is a drop-in, much faster decoder; its JSONDecodeError subclasses json's
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 
 def parse_messages_to_str(messages):
     res = ""
@@ -14,13 +21,64 @@ def parse_response_to_str(response):
     return response.get("content")
 
 
-def parse_json_response(response_str):
-    pattern = r"```json\s*(.*?)```"
-    match = re.search(pattern, response_str, re.DOTALL | re.IGNORECASE)
-    
+# Compiled once; applied to every LLM response
+_JSON_FENCE_RE = re.compile(r"```json\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+def extract_json_text(response_str):
+    """Return the JSON payload of an LLM response, without any ```json fence"""
+    # Unfenced output (e.g. schema-constrained decoding) skips the regex entirely
+    if "```" not in response_str:
+        return response_str.strip()
+    match = _JSON_FENCE_RE.search(response_str)
     if match:
-        text = match.group(1).strip()
-    else:
-        text = response_str.strip()
-    
-    return json.loads(text)
+        return match.group(1).strip()
+    return response_str.strip()
+
+
+def parse_json_response(response_str):
+    return _json_loads(extract_json_text(response_str))
+
+
+def iter_json_list_items(chunks):
+    """
+    Incrementally scan a streamed JSON list response.
+
+    Yields the raw text of each object in the first JSON list as soon as its
+    closing brace arrives, so callers can decode items while the rest of the
+    response is still being generated. Markdown fences and prose before the
+    list are skipped.
+    """
+    started = False
+    depth = 0
+    in_string = False
+    escaped = False
+    buf = []
+    for chunk in chunks:
+        for ch in chunk:
+            if not started:
+                started = ch == "["
+                continue
+            if depth == 0:
+                if ch == "{":
+                    depth = 1
+                    buf = [ch]
+                elif ch == "]":
+                    return
+                continue
+            buf.append(ch)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    yield "".join(buf)
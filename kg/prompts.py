@@ -1273,8 +1273,9 @@ Provide the plan in the following JSON format. Follow it strictly:
   else:
      return EXERCISE_GENERATION_SYSTEM_PROMPTs[0]
 
-def GET_DIET_GENERATION_SYSTEM_PROMPT():
-  DIET_GENERATION_SYSTEM_PROMPTs = [
+# Built once at import so every request sends a byte-identical system prefix
+# (lets providers/servers with prefix caching reuse its KV cache)
+DIET_GENERATION_SYSTEM_PROMPTs = [
 # Version 0
 f"""You are a certified clinical dietitian specializing in precision portion planning for one meal. Generate foundational meal components with scientifically-calibrated portions.
 
@@ -1711,6 +1712,62 @@ Generate core components for a single nutritionally-balanced meal aligned with t
 
 ]
 
+
+# Same contract as Version 0 with one-letter keys, for fewer output tokens
+DIET_GENERATION_SYSTEM_PROMPT_COMPACT = f"""You are a certified clinical dietitian specializing in precision portion planning for one meal. Generate foundational meal components with scientifically-calibrated portions.
+
+## Output Format
+Output MUST be a valid JSON list of objects. Each object is a food item with these fields:
+- "n": string (Name of the food)
+- "p": number (Numeric portion quantity, e.g., 120, 2.0)
+- "u": string (Portion unit, MUST be one of: {UNIT_LIST_STR})
+- "c": number (TOTAL calories for the ENTIRE portion.)
+
+## Example Output:
+[{{"n": "Herb-Roasted Chicken Thigh", "p": 130, "u": "gram", "c": 220}}, {{"n": "Steamed Broccoli", "p": 1.5, "u": "cup", "c": 55}}]
+"""
+
+
+# For requests that plan several meals at once (DietAgent.generate(batch_meals=True));
+# same item fields as above, but the output is one object keyed by meal
+_DIET_MULTI_MEAL_SYSTEM_PROMPT_TEMPLATE = """You are a certified clinical dietitian specializing in precision portion planning for several meals of one day. Generate foundational meal components with scientifically-calibrated portions for each requested meal.
+
+## Output Format
+Output MUST be a valid JSON object. Each key is a requested meal name and each value is a JSON list of food items with these fields:
+{fields}
+
+## Example Output:
+{example}
+"""
+
+DIET_MULTI_MEAL_SYSTEM_PROMPT = _DIET_MULTI_MEAL_SYSTEM_PROMPT_TEMPLATE.format(
+    fields=f"""- "food_name": string (Name of the food)
+- "portion_number": number (Numeric quantity, e.g., 120, 2.0)
+- "portion_unit": string (MUST be one of: {UNIT_LIST_STR})
+- "total_calories": number (TOTAL calories for the ENTIRE portion.)""",
+    example='{"breakfast": [{"food_name": "Rolled Oats", "portion_number": 60, "portion_unit": "gram", "total_calories": 230}], '
+            '"lunch": [{"food_name": "Herb-Roasted Chicken Thigh", "portion_number": 130, "portion_unit": "gram", "total_calories": 220}]}'
+)
+
+DIET_MULTI_MEAL_SYSTEM_PROMPT_COMPACT = _DIET_MULTI_MEAL_SYSTEM_PROMPT_TEMPLATE.format(
+    fields=f"""- "n": string (Name of the food)
+- "p": number (Numeric portion quantity, e.g., 120, 2.0)
+- "u": string (Portion unit, MUST be one of: {UNIT_LIST_STR})
+- "c": number (TOTAL calories for the ENTIRE portion.)""",
+    example='{"breakfast": [{"n": "Rolled Oats", "p": 60, "u": "gram", "c": 230}], '
+            '"lunch": [{"n": "Herb-Roasted Chicken Thigh", "p": 130, "u": "gram", "c": 220}]}'
+)
+
+
+def GET_DIET_MULTI_MEAL_SYSTEM_PROMPT(compact: bool = False):
+  if compact:
+    return DIET_MULTI_MEAL_SYSTEM_PROMPT_COMPACT
+  return DIET_MULTI_MEAL_SYSTEM_PROMPT
+
+
+def GET_DIET_GENERATION_SYSTEM_PROMPT(compact: bool = False):
+  if compact:
+    return DIET_GENERATION_SYSTEM_PROMPT_COMPACT
   if False:
     return random.choice(DIET_GENERATION_SYSTEM_PROMPTs)
   else:
@@ -1878,73 +1935,70 @@ Generate {meal_type} foods totaling ~{target} kcal. List only JSON."""
     return prompt
 
 
-def build_diet_prompt(
-    user_meta: Dict[str, Any],
-    environment: Dict[str, Any],
-    requirement: Dict[str, Any],
-    target_calories: int,
-    meal_type: str = "breakfast",
-    kg_context: str = "",
-    user_preference: str = None
-) -> str:
-    """Build the user prompt for a specific meal type generation"""
-    conditions = user_meta.get("medical_conditions", [])
-    restrictions = user_meta.get("dietary_restrictions", [])
-
-    # Calorie targets per meal
-    meal_targets = {
-        "breakfast": int(target_calories * 0.25),
-        "lunch": int(target_calories * 0.35),
-        "dinner": int(target_calories * 0.30),
-        "snacks": int(target_calories * 0.10)
-    }
-    target = meal_targets.get(meal_type, int(target_calories * 0.25))
+# "Instruction - Context - Constraint" structure;
+# User Preference is placed at top as HIGHEST PRIORITY
+_DIET_PROMPT_TEMPLATE = """## TARGET TASK
+Generate a meal plan for the following user.
+{preference_block}
+## Profile:
+{profile}
 
-    # Build prompt with "Instruction - Context - Constraint" structure
-    # User Preference is placed at top as HIGHEST PRIORITY
+## Environment:
+{environment}
 
-    prompt = f"""## TARGET TASK
-Generate a meal plan for the following user.
-"""
+## Use the following knowledge to generate a plan that user prefered:
+{kg_context}{meal_block}"""
 
-    # User Preference at the TOP with HIGHEST PRIORITY
-    if user_preference:
-        prompt += f"""
+_DIET_PREFERENCE_BLOCK = """
 ### USER REQUEST (HIGHEST PRIORITY):
 The user strictly explicitly wants: "{user_preference}"
 """
 
-    # Build user profile section
-    # profile_parts = [
-    #     f"Age: {user_meta.get('age', 30)}",
-    #     f"Gender: {user_meta.get('gender', 'male')}",
-    # ]
-    profile_parts = json.dumps(user_meta, ensure_ascii=False, indent=2)
-    if conditions:
-        profile_parts.append(f"Conditions: {', '.join(conditions)}")
-    if restrictions:
-        profile_parts.append(f"Restrictions: {', '.join(restrictions)}")
-
-    prompt += f"""
-## Profile:
-{chr(10).join(profile_parts)}
+# Kept last so the profile/KG part of the prompt is identical across a user's meals
+_DIET_MEAL_BLOCK = """
+## Meal:
+Generate {meal_type} foods totaling ~{target} kcal.
+"""
 
-## Environment:
-{environment}
 
-## Use the following knowledge to generate a plan that user prefered:
-{kg_context}"""
+def build_diet_prompt(
+    user_meta: Dict[str, Any],
+    environment: Dict[str, Any],
+    requirement: Dict[str, Any],
+    target_calories: int,
+    meal_type: Optional[str] = None,
+    kg_context: str = "",
+    user_preference: str = None,
+    target: Optional[int] = None
+) -> str:
+    """
+    Build the user prompt for a specific meal type generation.
+    target is the meal's calorie target, computed once by the caller (DietAgent.generate).
+    Without meal_type and target the meal block is left out (multi-meal requests
+    state their own targets).
+    """
+    params = {
+        "preference_block": _DIET_PREFERENCE_BLOCK.format(user_preference=user_preference) if user_preference else "",
+        # Compact JSON; medical_conditions and dietary_restrictions are already part of it
+        "profile": json.dumps(user_meta, ensure_ascii=False),
+        "environment": environment,
+        "kg_context": kg_context,
+        "meal_block": _DIET_MEAL_BLOCK.format(meal_type=meal_type, target=target) if meal_type and target is not None else "",
+    }
+    # Output format and units are defined once in the system prompt
+    return _DIET_PROMPT_TEMPLATE.format_map(params)
 
-    prompt += f"""\n## Output Format
-JSON list of foods. Each item:
-- food_name: name
-- portion_number: number
-- portion_unit: {UNIT_LIST_STR}
-- calories_per_unit: calories per single unit
 
-"""
+def build_multi_meal_instruction(meal_targets: Dict[str, int]) -> str:
+    """Suffix for the diet user prompt that asks for several meals in one response"""
+    meals = ", ".join(f"{meal} (~{target} kcal)" for meal, target in meal_targets.items())
+    example = ", ".join(f'"{meal}": [...]' for meal in meal_targets)
+    return f"""
 
-    return prompt
+## Meals
+Plan each of these meals separately: {meals}.
+Return ONE JSON object keyed by meal name, each value a JSON list of food items:
+{{{example}}}"""
 
 
 DIET_KG_EXTRACT_COT_PROMPT_v0 = """